@@ -6,6 +6,17 @@ import litellm
 
 log = logging.getLogger(__name__)
 
+TAG_OPEN = "<think>"
+TAG_CLOSE = "</think>"
+
+
+def _partial_tag_len(data: str, start: int, tag: str) -> int:
+    """Length of the suffix of data[start:] that could be the start of tag."""
+    lt = data.rfind("<", max(start, len(data) - len(tag) + 1))
+    if lt != -1 and tag.startswith(data[lt:]):
+        return len(data) - lt
+    return 0
+
 
 class LLMClient:
     """Streaming LLM client supporting Ollama and OpenRouter."""
@@ -23,6 +34,7 @@ class LLMClient:
         self.api_base = api_base if provider == "ollama" else None
         self.max_tokens = max_tokens
         self.temperature = temperature
+        self._extra_body = self._build_extra_body()
 
     def _build_extra_body(self) -> dict | None:
         """Configure provider-specific options."""
@@ -45,86 +57,75 @@ class LLMClient:
             }
             if self.api_base:
                 kwargs["api_base"] = self.api_base
-            extra_body = self._build_extra_body()
-            if extra_body:
-                kwargs["extra_body"] = extra_body
+            if self._extra_body:
+                kwargs["extra_body"] = dict(self._extra_body)  # Copy so LiteLLM can't mutate the shared one
 
-            log.info(f"llm start model={self.model} max_tokens={self.max_tokens}")
+            log.info("llm start model=%s max_tokens=%s", self.model, self.max_tokens)
             response = await litellm.acompletion(**kwargs)
 
             chunk_count = 0
             thinking_chunks = 0
             content_chunks = 0
             in_thinking = False
-            buffer = ""
+            carry = ""  # Possible partial tag held back from the previous delta
 
             async for chunk in response:
                 chunk_count += 1
-                content = self._extract_content(chunk)
+                choices = getattr(chunk, "choices", None)
+                if not choices:
+                    continue
+                choice = choices[0]
+                content = self._extract_content(choice)
                 if content:
-                    buffer += content
-
-                    # Parse thinking tags
-                    while buffer:
-                        if in_thinking:
-                            end_idx = buffer.find("</think>")
-                            if end_idx != -1:
-                                if end_idx > 0:
-                                    thinking_chunks += 1
-                                    yield ("thinking", buffer[:end_idx])
-                                buffer = buffer[end_idx + 8:]
-                                in_thinking = False
-                            else:
-                                # Partial thinking, yield and clear
+                    # Parse thinking tags over the new delta plus any carried tag prefix
+                    data = carry + content
+                    pos = 0
+                    while True:
+                        tag = TAG_CLOSE if in_thinking else TAG_OPEN
+                        idx = data.find(tag, pos)
+                        if idx == -1:
+                            break
+                        if idx > pos:
+                            if in_thinking:
                                 thinking_chunks += 1
-                                yield ("thinking", buffer)
-                                buffer = ""
-                                break
-                        else:
-                            start_idx = buffer.find("<think>")
-                            if start_idx != -1:
-                                if start_idx > 0:
-                                    content_chunks += 1
-                                    yield ("content", buffer[:start_idx])
-                                buffer = buffer[start_idx + 7:]
-                                in_thinking = True
                             else:
-                                # Check for partial tag at end
-                                if buffer.endswith("<") or any(buffer.endswith("<think>"[:i]) for i in range(1, 7)):
-                                    break  # Wait for more data
                                 content_chunks += 1
-                                yield ("content", buffer)
-                                buffer = ""
-                                break
+                            yield ("thinking" if in_thinking else "content", data[pos:idx])
+                        pos = idx + len(tag)
+                        in_thinking = not in_thinking
+
+                    # Hold back a partial tag at the end until the next delta
+                    split = len(data) - _partial_tag_len(data, pos, tag)
+                    if split > pos:
+                        if in_thinking:
+                            thinking_chunks += 1
+                        else:
+                            content_chunks += 1
+                        yield ("thinking" if in_thinking else "content", data[pos:split])
+                    carry = data[split:]
 
                 # Check for finish reason
-                if hasattr(chunk, "choices") and chunk.choices:
-                    finish = chunk.choices[0].finish_reason
-                    if finish:
-                        log.info(f"llm finish reason={finish} chunks={chunk_count}")
+                finish = getattr(choice, "finish_reason", None)
+                if finish:
+                    log.info("llm finish reason=%s chunks=%s", finish, chunk_count)
 
-            # Flush remaining buffer
-            if buffer:
+            # Flush held-back partial tag
+            if carry:
                 if in_thinking:
                     thinking_chunks += 1
                 else:
                     content_chunks += 1
-                yield ("thinking" if in_thinking else "content", buffer)
+                yield ("thinking" if in_thinking else "content", carry)
 
-            log.info(f"llm stream ended chunks={chunk_count} thinking={thinking_chunks} content={content_chunks}")
+            log.info("llm stream ended chunks=%s thinking=%s content=%s", chunk_count, thinking_chunks, content_chunks)
         except litellm.exceptions.ServiceUnavailableError:
             raise ConnectionError(f"{self.provider} unavailable")
         except Exception as e:
-            log.exception(f"llm error: {e}")
+            log.exception("llm error: %s", e)
             raise ConnectionError(f"LLM error: {e}")
 
-    def _extract_content(self, chunk) -> str:
-        """Extract text from various chunk formats."""
-        try:
-            if hasattr(chunk, "choices") and chunk.choices:
-                delta = chunk.choices[0].delta
-                if hasattr(delta, "content") and delta.content:
-                    return delta.content
-            return ""
-        except (AttributeError, KeyError, IndexError):
-            return ""
+    def _extract_content(self, choice) -> str:
+        """Extract delta text from a streamed choice."""
+        delta = getattr(choice, "delta", None)
+        content = getattr(delta, "content", None) if delta is not None else None
+        return content or ""
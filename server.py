@@ -1,21 +1,26 @@
 """FastAPI server with WebSocket streaming for AI music generation."""
 
 import asyncio
+import inspect
+import json
 import logging
 import os
-import re
 import time
 import uuid
+from contextlib import aclosing, asynccontextmanager
+from functools import lru_cache
 from pathlib import Path
 
 import httpx
+import litellm
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
 
 from llm import LLMClient
 
 OLLAMA_BASE = "http://localhost:11434"
+MODELS_CACHE_TTL = 5.0
 OPENROUTER_MODELS = [
     {"id": "google/gemini-3-pro-preview", "name": "Gemini 3 Pro"},
     {"id": "google/gemini-3-flash-preview", "name": "Gemini 3 Flash"},
@@ -26,7 +31,25 @@ OPENROUTER_MODELS = [
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 log = logging.getLogger(__name__)
 
-app = FastAPI()
+
+# Ollama API client, open while the app is running
+ollama_client: httpx.AsyncClient | None = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Share HTTP connection pools across requests, closing them on shutdown."""
+    global ollama_client
+    litellm.aclient_session = httpx.AsyncClient(timeout=httpx.Timeout(IDLE_CHUNK_GAP, connect=10.0))
+    ollama_client = httpx.AsyncClient(base_url=OLLAMA_BASE, timeout=5.0)
+    yield
+    await litellm.aclient_session.aclose()
+    litellm.aclient_session = None
+    await ollama_client.aclose()
+    ollama_client = None
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Instrument bank definitions - each bank has 8 instruments (IDs 0-7)
 INSTRUMENT_BANKS = {
@@ -91,28 +114,27 @@ INSTRUMENT_BANKS = {
 # Default bank for backwards compatibility
 DEFAULT_BANK = "electronic"
 
-def get_bank_instruments(bank_id: str) -> dict:
-    """Get instruments for a bank, defaulting to electronic."""
-    bank = INSTRUMENT_BANKS.get(bank_id, INSTRUMENT_BANKS[DEFAULT_BANK])
-    return bank["instruments"]
+_BANK_INSTRUMENTS = {bid: bank["instruments"] for bid, bank in INSTRUMENT_BANKS.items()}
+
+def _instrument_line(i: int, inst: dict) -> str:
+    """Format one instrument for the system prompt list."""
+    r = inst["range"]
+    return f"- {i}: {inst['name']} (range {r[0]}-{r[1]}) - {inst['desc']}"
+
+# Per-bank instrument names and prompt lines, in ID order
+_BANK_NAMES = {bid: tuple(insts[i]["name"] for i in range(8)) for bid, insts in _BANK_INSTRUMENTS.items()}
+_BANK_LINES = {bid: tuple(_instrument_line(i, insts[i]) for i in range(8)) for bid, insts in _BANK_INSTRUMENTS.items()}
 
 def build_instrument_list(bank_id: str) -> str:
     """Build instrument list description for a bank."""
-    instruments = get_bank_instruments(bank_id)
-    lines = []
-    for i in range(8):
-        inst = instruments[i]
-        r = inst["range"]
-        lines.append(f"- {i}: {inst['name']} (range {r[0]}-{r[1]}) - {inst['desc']}")
-    return "\n".join(lines)
+    return "\n".join(_BANK_LINES.get(bank_id, _BANK_LINES[DEFAULT_BANK]))
 
 def build_instrument_summary(bank_id: str) -> str:
     """Build short instrument summary for refinement prompt."""
-    instruments = get_bank_instruments(bank_id)
-    parts = [f"{i}={instruments[i]['name']}" for i in range(8)]
-    return ", ".join(parts)
+    names = _BANK_NAMES.get(bank_id, _BANK_NAMES[DEFAULT_BANK])
+    return ", ".join(f"{i}={name}" for i, name in enumerate(names))
 
-def get_system_prompt(bank_id: str | None) -> str:
+def _build_system_prompt(bank_id: str | None) -> str:
     """Generate system prompt with bank-specific instruments."""
     bank_info = INSTRUMENT_BANKS.get(bank_id) if bank_id else None
 
@@ -122,7 +144,7 @@ Style: {bank_info['desc']}
 IMPORTANT: Only use instruments from this bank. Do not suggest switching banks.
 
 """
-        instrument_list = build_instrument_list(bank_id)
+        instrument_list = _INSTRUMENT_LIST_CACHE[bank_id]
     else:
         # Auto mode - LLM chooses bank
         bank_options = "\n".join([f"- {bid}: {b['name']} - {b['desc']}" for bid, b in INSTRUMENT_BANKS.items()])
@@ -135,7 +157,7 @@ Then output note events. Example first line: {{"bank": "electronic"}}
 
 """
         # Show electronic as example
-        instrument_list = build_instrument_list(DEFAULT_BANK)
+        instrument_list = _INSTRUMENT_LIST_CACHE[DEFAULT_BANK]
 
     return f"""You are a music composer generating MIDI sequences with multiple instruments.
 
@@ -160,16 +182,16 @@ Example:
 {{"t": 0, "n": 60, "v": 65, "d": 1500, "i": 4}}
 {{"t": 500, "n": 72, "v": 85, "d": 500, "i": 0}}"""
 
-def get_refinement_prompt(bank_id: str, end_time: int) -> str:
-    """Generate refinement prompt with bank-specific instruments."""
-    bank_info = INSTRUMENT_BANKS.get(bank_id, INSTRUMENT_BANKS[DEFAULT_BANK])
-    instrument_summary = build_instrument_summary(bank_id)
+def _build_refinement_template(bank_id: str) -> str:
+    """Generate refinement prompt template with an {end_time} placeholder."""
+    bank_info = INSTRUMENT_BANKS[bank_id]
+    instrument_summary = _INSTRUMENT_SUMMARY_CACHE[bank_id]
 
     return f"""You are ADDING to an existing MIDI sequence with multiple instruments.
-The existing sequence ends at time {end_time}ms.
+The existing sequence ends at time {{end_time}}ms.
 Instrument bank: {bank_info['name']} ({bank_info['desc']})
 
-- Start your new notes AFTER the existing sequence (t > {end_time})
+- Start your new notes AFTER the existing sequence (t > {{end_time}})
 - Continue the musical style, key, and instrumentation
 - Use the same instruments (i field) as the existing composition
 - Output ONLY new note events as JSON, one per line
@@ -177,36 +199,165 @@ Instrument bank: {bank_info['name']} ({bank_info['desc']})
 
 Available instruments: {instrument_summary}"""
 
+# Prompts only vary by bank, so build every variant once at import
+_INSTRUMENT_LIST_CACHE = {bid: build_instrument_list(bid) for bid in INSTRUMENT_BANKS}
+_INSTRUMENT_SUMMARY_CACHE = {bid: build_instrument_summary(bid) for bid in INSTRUMENT_BANKS}
+_SYSTEM_PROMPT_CACHE = {bid: _build_system_prompt(bid) for bid in [*INSTRUMENT_BANKS, None]}
+# Refinement templates pre-split on the {end_time} placeholder, joined back with the value
+_REFINEMENT_PARTS_CACHE = {bid: tuple(_build_refinement_template(bid).split("{end_time}")) for bid in INSTRUMENT_BANKS}
+
+def get_system_prompt(bank_id: str | None) -> str:
+    """Get system prompt for a bank, or the auto-pick prompt if no valid bank."""
+    return _SYSTEM_PROMPT_CACHE.get(bank_id, _SYSTEM_PROMPT_CACHE[None])
+
+def get_refinement_prompt(bank_id: str, end_time: int) -> str:
+    """Get refinement prompt for a bank, defaulting to electronic."""
+    parts = _REFINEMENT_PARTS_CACHE.get(bank_id, _REFINEMENT_PARTS_CACHE[DEFAULT_BANK])
+    return str(end_time).join(parts)
+
 # Timeouts (seconds) - generous for local LLMs
 START_CHUNK_DEADLINE = 60.0
 IDLE_CHUNK_GAP = 60.0
 REQUEST_HARD_LIMIT = 300.0
 MAX_PROMPT_LEN = 512
 
+# Shared compact encoder, json.dumps builds a fresh JSONEncoder per call when given options
+_encode_json = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+async def send_json_fast(websocket: WebSocket, msg: dict):
+    """Send a message as a JSON text frame using the shared encoder."""
+    await websocket.send_text(_encode_json(msg))
+
+
+async def _wait_cancelled(task: asyncio.Task):
+    """Wait for a cancelled helper task to finish, ignoring how it ended.
+
+    A cancel of the calling task that arrives meanwhile is still raised.
+    """
+    caller = asyncio.current_task()
+    cancelling = caller.cancelling()
+    try:
+        await task
+    except asyncio.CancelledError:
+        if caller.cancelling() > cancelling:
+            raise
+    except Exception:
+        pass
+
+
+# Chunk batching - coalesce streamed deltas into fewer WebSocket frames
+BATCH_FLUSH_INTERVAL = 0.04
+BATCH_MAX_CHUNKS = 16
+BATCH_MAX_BYTES = 4096
+
+# Chunks buffered between the LLM reader and the WebSocket sender
+STREAM_QUEUE_SIZE = 64
+
+
+class ChunkBatcher:
+    """Coalesce consecutive same-type stream chunks into single WebSocket frames.
+
+    The batch size starts at one chunk so the first frame of each type goes out
+    immediately, then doubles per flush up to BATCH_MAX_CHUNKS. A background task
+    flushes whatever is pending every BATCH_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, websocket: WebSocket, req_id: str):
+        self.websocket = websocket
+        self.req_id = req_id
+        self.frames_sent = 0
+        self._type = None
+        self._parts = []
+        self._size = 0
+        self._limit = 1
+        self._lock = asyncio.Lock()
+        self._task = None
+        # Frames only differ in their data, so encode everything before it once
+        self._prefixes = {
+            chunk_type: _encode_json({"type": msg_type, "id": req_id, "data": ""})[:-3]
+            for chunk_type, msg_type in (("thinking", "thinking"), ("content", "chunk"))
+        }
+
+    def start(self):
+        """Start the periodic flusher."""
+        self._task = asyncio.create_task(self._run())
+
+    async def add(self, chunk_type: str, data: str):
+        """Queue a chunk, flushing first if the chunk type changes."""
+        if self._type != chunk_type:
+            await self.flush()
+            self._type = chunk_type
+            self._limit = 1
+        self._parts.append(data)
+        self._size += len(data)
+        if len(self._parts) >= self._limit or self._size >= BATCH_MAX_BYTES:
+            await self.flush()
+
+    async def flush(self):
+        """Send all pending chunks as one frame."""
+        async with self._lock:
+            if not self._parts:
+                return
+            data = "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            self._limit = min(self._limit * 2, BATCH_MAX_CHUNKS)
+            prefix = self._prefixes["thinking" if self._type == "thinking" else "content"]
+            await self.websocket.send_text(prefix + _encode_json(data) + "}")
+            self.frames_sent += 1
+
+    async def close(self):
+        """Stop the periodic flusher without sending pending chunks."""
+        if self._task:
+            # Take the lock so the flusher is never cancelled halfway through a send
+            async with self._lock:
+                self._task.cancel()
+            await _wait_cancelled(self._task)
+            self._task = None
+
+    async def _run(self):
+        try:
+            while True:
+                await asyncio.sleep(BATCH_FLUSH_INTERVAL)
+                await self.flush()
+        except Exception:
+            pass  # Client disconnected, the compose loop notices on its next send
+
+
+# Translation table deleting C0 and C1 control characters
+_CTRL_DELETE = dict.fromkeys([*range(0x00, 0x20), *range(0x7f, 0xa0)])
+_CTRL_CHARS = frozenset(map(chr, _CTRL_DELETE))
+
 
 def sanitize_prompt(prompt: str) -> str:
     """Trim and remove control characters."""
     prompt = prompt.strip()
-    prompt = re.sub(r"[\x00-\x1f\x7f-\x9f]", "", prompt)
-    return prompt
+    # Most prompts are clean, skip building a translated copy. isprintable() is the
+    # cheapest check but also rejects harmless characters like NBSP or emoji joiners.
+    if prompt.isprintable() or _CTRL_CHARS.isdisjoint(prompt):
+        return prompt
+    return prompt.translate(_CTRL_DELETE)
 
 
-def calculate_end_time(midi_notes: list) -> int:
-    """Calculate the end time of the last note in milliseconds."""
-    if not midi_notes:
-        return 0
-    max_end = 0
-    for note in midi_notes:
-        end = note.get("t", 0) + note.get("d", 0)
-        if end > max_end:
-            max_end = end
-    return max_end
+# Longest partial content line held for note parsing, note events are far shorter
+MAX_LINE_LEN = 4096
+
+# Keys every note event must carry
+_REQUIRED_NOTE_KEYS = frozenset(("t", "n", "v", "d"))
+
+
+@lru_cache(maxsize=32)
+def get_llm_client(model: str, provider: str, max_tokens: int) -> LLMClient:
+    """Get a shared LLM client for this model configuration."""
+    return LLMClient(model=model, provider=provider, max_tokens=max_tokens)
 
 
 async def handle_compose(websocket: WebSocket, prompt: str, req_id: str, model: str, provider: str, cancel_event: asyncio.Event, max_tokens: int = 100000, session: dict = None, refine: bool = False, bank_id: str = None):
     """Handle a single compose request with streaming."""
-    start_time = time.monotonic()
-    first_chunk_time = None
+    rid = req_id[:8]  # Short id for log lines
+    start_ns = time.perf_counter_ns()
+    first_chunk_ns = None
     cancelled = False
     error_reason = None
 
@@ -220,16 +371,16 @@ async def handle_compose(websocket: WebSocket, prompt: str, req_id: str, model:
         session["bank"] = effective_bank
 
     # Build messages based on mode
-    if refine and session and session.get("last_midi"):
+    if refine and session and session.get("last_midi_count", 0) > 0:
         # Refinement mode: add to existing composition
-        end_time = calculate_end_time(session["last_midi"])
+        end_time = session.get("last_midi_end", 0)
         refine_bank = session.get("bank", DEFAULT_BANK)
         messages = [
             {"role": "system", "content": get_refinement_prompt(refine_bank, end_time)},
-            {"role": "user", "content": f"The existing composition is: {session['original_prompt']}"},
+            {"role": "user", "content": session["original_message"]},
             {"role": "user", "content": f"Add to the composition: {prompt}"},
         ]
-        log.info(f"req={req_id[:8]} refine mode end_time={end_time} bank={refine_bank}")
+        log.info("req=%s refine mode end_time=%s bank=%s", rid, end_time, refine_bank)
     else:
         # New composition mode
         messages = [
@@ -237,85 +388,141 @@ async def handle_compose(websocket: WebSocket, prompt: str, req_id: str, model:
             {"role": "user", "content": f"Compose: {prompt}"},
         ]
         if session is not None:
-            session["original_prompt"] = prompt
-            session["last_midi"] = []
+            session["original_message"] = f"The existing composition is: {prompt}"  # Reused by every refine
+            session["last_midi_count"] = 0
+            session["last_midi_end"] = 0
             if effective_bank:
                 session["bank"] = effective_bank
-        log.info(f"req={req_id[:8]} new composition bank={effective_bank or 'auto'}")
-
-    llm_client = LLMClient(model=model, provider=provider, max_tokens=max_tokens)
-    await websocket.send_json({"type": "start", "id": req_id})
+        log.info("req=%s new composition bank=%s", rid, effective_bank or "auto")
 
     async def safe_send(msg):
         try:
-            await websocket.send_json(msg)
+            await send_json_fast(websocket, msg)
         except Exception:
             pass  # Client disconnected
 
-    accumulated_content = ""
-    try:
-        chunks_sent = 0
-        async for chunk_type, chunk_data in llm_client.stream_completion(messages):
-            if cancel_event.is_set():
-                cancelled = True
-                await safe_send({"type": "cancelled", "id": req_id})
-                log.info(f"req={req_id[:8]} cancelled after {chunks_sent} chunks")
+    async def flush_pending():
+        """Stop the batcher and send what it still holds, ahead of a terminal frame."""
+        await batcher.close()
+        try:
+            await batcher.flush()
+        except Exception:
+            pass  # Client disconnected
+
+    # Session bookkeeping, parsed line by line as content streams in
+    notes_parsed = 0
+    detected_bank = None
+    content_tail = ""
+    tail_overflow = False  # Discarding a line that outgrew MAX_LINE_LEN
+
+    def parse_line(line: str):
+        """Record a bank selection or note event from one line of content."""
+        nonlocal detected_bank, notes_parsed
+        line = line.strip()
+        # Only objects matter, the decoder rejects anything malformed or truncated
+        if not line or line[0] != "{":
+            return
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            return
+        # Check for bank selection (LLM auto-pick)
+        if "bank" in obj and not detected_bank:
+            selected_bank = str(obj["bank"]).strip().lower()
+            if selected_bank in INSTRUMENT_BANKS:
+                detected_bank = selected_bank
+                session["bank"] = detected_bank
+                log.info("req=%s LLM selected bank=%s", rid, detected_bank)
+        # Check for note event
+        elif _REQUIRED_NOTE_KEYS <= obj.keys():
+            t, d = obj["t"], obj["d"]
+            if not (isinstance(t, (int, float)) and isinstance(d, (int, float))):
                 return
+            end = t + d
+            # Update the session as notes arrive so a cancelled stream keeps what was played
+            notes_parsed += 1
+            session["last_midi_count"] += 1
+            if end > session["last_midi_end"]:
+                session["last_midi_end"] = end
+
+    # The LLM reader feeds a bounded queue so slow WebSocket sends don't stall it
+    queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+    producer = None
+
+    async def produce(llm_client: LLMClient):
+        """Read LLM chunks into the queue within the deadlines, ending with a None sentinel."""
+        try:
+            loop = asyncio.get_running_loop()
+            async with asyncio.timeout(REQUEST_HARD_LIMIT):
+                async with aclosing(llm_client.stream_completion(messages)) as stream:
+                    # One timer for the whole stream, pushed forward per item instead of a task per read
+                    async with asyncio.timeout(START_CHUNK_DEADLINE) as gap:
+                        async for item in stream:
+                            gap.reschedule(None)  # Waiting on a full queue is not an LLM stall
+                            await queue.put(item)
+                            gap.reschedule(loop.time() + IDLE_CHUNK_GAP)
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
 
-            if first_chunk_time is None:
-                first_chunk_time = time.monotonic() - start_time
+    batcher = ChunkBatcher(websocket, req_id)
+    batcher.start()
+    try:
+        chunks_sent = 0
+        producer = asyncio.create_task(produce(get_llm_client(model, provider, max_tokens)))
 
-            # Accumulate content for session history
-            if chunk_type == "content":
-                accumulated_content += chunk_data
+        # The LLM request is already in flight while the start frame goes out
+        try:
+            await send_json_fast(websocket, {"type": "start", "id": req_id})
+        except Exception:
+            log.info("req=%s client disconnected before start", rid)
+            return
+
+        while (item := await queue.get()) is not None:
+            chunk_type, chunk_data = item
+            if first_chunk_ns is None:
+                first_chunk_ns = time.perf_counter_ns() - start_ns
+
+            # Parse complete content lines for session history
+            if chunk_type == "content" and session is not None:
+                if "\n" in chunk_data:
+                    lines = (content_tail + chunk_data).split("\n")
+                    content_tail = lines.pop()
+                    if tail_overflow:
+                        del lines[0]  # End of the overlong line
+                        tail_overflow = False
+                    for line in lines:
+                        parse_line(line)
+                elif not tail_overflow:
+                    content_tail += chunk_data
+                if len(content_tail) > MAX_LINE_LEN:
+                    # Too long to be a note event, drop the whole line up to its newline
+                    content_tail = ""
+                    tail_overflow = True
 
             try:
-                msg_type = "thinking" if chunk_type == "thinking" else "chunk"
-                await websocket.send_json({"type": msg_type, "id": req_id, "data": chunk_data})
+                await batcher.add(chunk_type, chunk_data)
                 chunks_sent += 1
             except Exception:
-                log.info(f"req={req_id[:8]} client disconnected after {chunks_sent} chunks")
+                log.info("req=%s client disconnected after %s chunks", rid, chunks_sent)
                 return
 
-        log.info(f"req={req_id[:8]} stream done, sent {chunks_sent} chunks")
-
-        # Parse accumulated content to extract MIDI notes and bank selection for session
-        if session is not None and accumulated_content:
-            import json
-            new_notes = []
-            detected_bank = None
-            instruments = get_bank_instruments(session.get("bank", DEFAULT_BANK))
-
-            for line in accumulated_content.split("\n"):
-                line = line.strip()
-                if line.startswith("{") and line.endswith("}"):
-                    try:
-                        obj = json.loads(line)
-                        # Check for bank selection (LLM auto-pick)
-                        if "bank" in obj and not detected_bank:
-                            selected_bank = str(obj["bank"]).strip().lower()
-                            if selected_bank in INSTRUMENT_BANKS:
-                                detected_bank = selected_bank
-                                session["bank"] = detected_bank
-                                instruments = get_bank_instruments(detected_bank)
-                                log.info(f"req={req_id[:8]} LLM selected bank={detected_bank}")
-                        # Check for note event
-                        elif all(k in obj for k in ["t", "n", "v", "d"]):
-                            # Default instrument to 0 if missing
-                            if "i" not in obj:
-                                obj["i"] = 0
-                            # Validate instrument ID (0-7)
-                            if obj["i"] not in instruments:
-                                obj["i"] = 0
-                            new_notes.append(obj)
-                    except json.JSONDecodeError:
-                        pass
-
-            if refine:
-                session["last_midi"].extend(new_notes)
-            else:
-                session["last_midi"] = new_notes
-            log.info(f"req={req_id[:8]} parsed {len(new_notes)} notes")
+        # Raise any LLM error that ended the stream
+        await producer
+
+        await batcher.close()
+        try:
+            await batcher.flush()
+        except Exception:
+            log.info("req=%s client disconnected after %s chunks", rid, chunks_sent)
+            return
+        log.info("req=%s stream done, sent %s chunks in %s frames", rid, chunks_sent, batcher.frames_sent)
+
+        if session is not None:
+            if content_tail:
+                parse_line(content_tail)
+            log.info("req=%s parsed %s notes", rid, notes_parsed)
 
         # Include bank in done message for client to update UI
         done_msg = {"type": "done", "id": req_id}
@@ -323,16 +530,36 @@ async def handle_compose(websocket: WebSocket, prompt: str, req_id: str, model:
             done_msg["bank"] = session["bank"]
         await safe_send(done_msg)
 
+    except asyncio.CancelledError:
+        cancelled = True
+        if cancel_event.is_set():
+            await flush_pending()
+            await safe_send({"type": "cancelled", "id": req_id})
+        log.info("req=%s cancelled after %s chunks", rid, chunks_sent)
+        raise
+    except TimeoutError:
+        error_reason = "timeout"
+        await flush_pending()
+        await safe_send({"type": "error", "id": req_id, "message": "LLM timed out."})
+        log.info("req=%s timed out after %s chunks", rid, chunks_sent)
     except ConnectionError as e:
         error_reason = "llm_unavailable"
+        await flush_pending()
         await safe_send({"type": "error", "id": req_id, "message": "Cannot connect to LLM. Is the service running?"})
     except Exception as e:
         error_reason = str(e)
+        await flush_pending()
         await safe_send({"type": "error", "id": req_id, "message": "An error occurred."})
-        log.exception(f"req={req_id[:8]} error")
+        log.exception("req=%s error", rid)
     finally:
-        total_duration = time.monotonic() - start_time
-        log.info(f"req={req_id[:8]} first_chunk_ms={int(first_chunk_time*1000) if first_chunk_time else None} total_ms={int(total_duration*1000)} cancelled={cancelled} error={error_reason}")
+        if producer:
+            producer.cancel()
+            await _wait_cancelled(producer)  # Errors were handled above, or abandoned on early exit
+        await batcher.close()
+        if log.isEnabledFor(logging.INFO):
+            total_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+            first_chunk_ms = first_chunk_ns // 1_000_000 if first_chunk_ns is not None else None
+            log.info("req=%s first_chunk_ms=%s total_ms=%s cancelled=%s error=%s", rid, first_chunk_ms, total_ms, cancelled, error_reason)
 
 
 @app.websocket("/ws/compose")
@@ -341,13 +568,32 @@ async def websocket_compose(websocket: WebSocket):
     await websocket.accept()
     log.info("ws connect")
 
-    current_task: asyncio.Task | None = None
-    cancel_event = asyncio.Event()
+    # Latest compose task, the event set once the user cancelled it, and its request id
+    current: tuple[asyncio.Task, asyncio.Event, str] | None = None
+    draining: set[asyncio.Task] = set()  # Cancelled tasks still winding down
+
+    async def cancel_current():
+        """Cancel the latest compose task without waiting for it to finish."""
+        if current is None:
+            return
+        task, cancel_event, req_id = current
+        # A second cancel would cut short the "cancelled" frame of the first
+        if cancel_event.is_set() or task.done():
+            return
+        # A task cancelled before its first step never reaches its own handler
+        not_started = inspect.getcoroutinestate(task.get_coro()) == inspect.CORO_CREATED
+        cancel_event.set()
+        task.cancel()
+        draining.add(task)
+        task.add_done_callback(draining.discard)
+        if not_started:
+            await send_json_fast(websocket, {"type": "cancelled", "id": req_id})
 
     # Session state for iterative refinement
     session = {
-        "original_prompt": None,
-        "last_midi": [],
+        "original_message": None,
+        "last_midi_count": 0,
+        "last_midi_end": 0,
         "tempo": 120,
         "bank": None,  # Will be set by client or LLM
     }
@@ -358,21 +604,19 @@ async def websocket_compose(websocket: WebSocket):
             msg_type = data.get("type")
 
             if msg_type == "ping":
-                await websocket.send_json({"type": "pong"})
+                await send_json_fast(websocket, {"type": "pong"})
 
             elif msg_type == "cancel":
-                if current_task and not current_task.done():
-                    cancel_event.set()
-                    await current_task
-                    cancel_event.clear()
+                await cancel_current()
 
             elif msg_type == "clear_session":
                 # Reset session state for new conversation
-                session["original_prompt"] = None
-                session["last_midi"] = []
+                session["original_message"] = None
+                session["last_midi_count"] = 0
+                session["last_midi_end"] = 0
                 session["tempo"] = 120
                 session["bank"] = None
-                await websocket.send_json({"type": "session_cleared"})
+                await send_json_fast(websocket, {"type": "session_cleared"})
                 log.info("session cleared")
 
             elif msg_type == "compose":
@@ -385,34 +629,32 @@ async def websocket_compose(websocket: WebSocket):
                 bank_id = data.get("bankId")  # "auto", "electronic", "acoustic", etc.
 
                 if not prompt:
-                    await websocket.send_json({"type": "error", "id": req_id, "message": "Prompt cannot be empty."})
+                    await send_json_fast(websocket, {"type": "error", "id": req_id, "message": "Prompt cannot be empty."})
                     continue
 
                 if len(prompt) > MAX_PROMPT_LEN:
-                    await websocket.send_json({"type": "error", "id": req_id, "message": f"Prompt too long (max {MAX_PROMPT_LEN} chars)."})
+                    await send_json_fast(websocket, {"type": "error", "id": req_id, "message": f"Prompt too long (max {MAX_PROMPT_LEN} chars)."})
                     continue
 
-                # Cancel existing task
-                if current_task and not current_task.done():
-                    cancel_event.set()
-                    await current_task
-                    cancel_event.clear()
+                # Cancel existing task, the new one starts while it winds down
+                await cancel_current()
 
-                # Start new task
-                current_task = asyncio.create_task(handle_compose(websocket, prompt, req_id, model, provider, cancel_event, max_tokens, session, refine, bank_id))
+                # Start new task with its own cancel event
+                cancel_event = asyncio.Event()
+                task = asyncio.create_task(handle_compose(websocket, prompt, req_id, model, provider, cancel_event, max_tokens, session, refine, bank_id))
+                current = (task, cancel_event, req_id)
 
     except WebSocketDisconnect:
         log.info("ws disconnect")
     except Exception as e:
         log.exception("ws error")
     finally:
-        if current_task and not current_task.done():
-            cancel_event.set()
-            current_task.cancel()
-            try:
-                await current_task
-            except asyncio.CancelledError:
-                pass
+        # Client is gone, cancel without setting the events so no "cancelled" frame is sent
+        tasks = {*draining, current[0]} if current else set(draining)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.wait(tasks)
 
 
 @app.get("/api/banks")
@@ -424,21 +666,33 @@ async def list_banks():
     return {"banks": banks, "default": DEFAULT_BANK}
 
 
+# (expires_at, encoded response) from the last request where Ollama answered
+_models_cache: tuple[float, bytes | None] = (0.0, None)
+
+
 @app.get("/api/models")
 async def list_models():
     """Fetch available models from Ollama and OpenRouter."""
+    global _models_cache
+
+    # Reuse a recent response to absorb rapid UI polls
+    expires_at, payload = _models_cache
+    if payload is not None and time.monotonic() < expires_at:
+        return Response(content=payload, media_type="application/json")
+
     models = []
+    ollama_ok = False
 
     # Fetch Ollama models
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(f"{OLLAMA_BASE}/api/tags", timeout=5.0)
-            resp.raise_for_status()
-            data = resp.json()
-            for m in data.get("models", []):
-                models.append({"name": m["name"], "provider": "ollama"})
+        resp = await ollama_client.get("/api/tags")
+        resp.raise_for_status()
+        data = resp.json()
+        for m in data.get("models", []):
+            models.append({"name": m["name"], "provider": "ollama"})
+        ollama_ok = True
     except Exception as e:
-        log.warning(f"Failed to fetch Ollama models: {e}")
+        log.warning("Failed to fetch Ollama models: %s", e)
 
     # Add OpenRouter models if API key exists
     if os.environ.get("OPENROUTER_API_KEY"):
@@ -448,7 +702,10 @@ async def list_models():
                 entry["maxTokens"] = m["maxTokens"]
             models.append(entry)
 
-    return {"models": models}
+    payload = _encode_json({"models": models}).encode()
+    if ollama_ok:
+        _models_cache = (time.monotonic() + MODELS_CACHE_TTL, payload)
+    return Response(content=payload, media_type="application/json")
 
 
 # Static files